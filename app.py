@@ -1,13 +1,25 @@
-from fastapi import FastAPI, Request, File, UploadFile, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import FastAPI, Request, File, UploadFile, Form, HTTPException, Depends
+from fastapi.responses import HTMLResponse, RedirectResponse, ORJSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import hashlib
+import multiprocessing
 import os
-import shutil
-from typing import Optional
+import sys
+import tempfile
+from typing import Any, Dict, Optional, Union
 
-from database import init_db
+import aiofiles
+import aiofiles.os
+from cachetools import TTLCache
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import init_db, get_db, warm_pool, AsyncSessionLocal
 from models import *
 from exam_service import ExamService
 
@@ -19,87 +31,204 @@ async def lifespan(app: FastAPI):
     """애플리케이션 생명주기 관리"""
     # 시작 시
     await init_db()
+    # PDF 파싱용 프로세스 풀 (스레드가 있는 프로세스를 fork하지 않도록 spawn 사용)
+    app.state.pool = ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    # 첫 요청 전에 모든 템플릿을 미리 컴파일 (바이트코드 캐시는 모듈 import 시가 아니라 시작 시에 연결)
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    templates.env.bytecode_cache = FileSystemBytecodeCache(directory=TEMPLATE_CACHE_DIR)
+    for name in templates.env.list_templates():
+        templates.env.get_template(name)
+    await warm_pool()
+    # 자주 쓰는 쿼리를 한 번씩 실행해 SQLAlchemy 컴파일 캐시를 미리 채움 (없는 ID라 결과는 비어 있음)
+    await exam_service.get_all_exams()
+    async with AsyncSessionLocal() as db:
+        await exam_service.get_session(db, -1)
+        await exam_service.get_first_question(db, -1)
+        await exam_service.get_question(db, -1)
+        await exam_service.warm_statements(db)
+    # 응답 저장을 묶어서 커밋하는 작업자
+    await exam_service.start_response_writer()
     yield
-    # 종료 시 (필요시 정리 작업)
+    # 종료 시
+    await exam_service.stop_response_writer()
+    app.state.pool.shutdown()
+
+app = FastAPI(
+    title="AWS SAA 시험 연습 앱",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
 
-app = FastAPI(title="AWS SAA 시험 연습 앱", version="1.0.0", lifespan=lifespan)
+# 응답 압축 (brotli-asgi가 설치되어 있으면 brotli, 없으면 gzip)
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=1024)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 # 정적 파일 및 템플릿 설정
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-# 메인 페이지
-@app.get("/", response_class=HTMLResponse)
-async def index(request: Request):
-    exams = await exam_service.get_all_exams()
-    return templates.TemplateResponse("index.html", {"request": request, "exams": exams})
+# 템플릿 바이트코드 캐시 디렉터리 (재시작 후에도 유지, lifespan에서 생성)
+TEMPLATE_CACHE_DIR = ".jinja_cache"
+# 렌더링마다 템플릿 파일을 다시 확인하지 않음 (개발 시 TEMPLATE_AUTO_RELOAD=1)
+templates.env.auto_reload = os.getenv("TEMPLATE_AUTO_RELOAD") == "1"
 
-# PDF 업로드
-@app.post("/import/pdf")
-async def import_pdf(file: UploadFile = File(...)):
+# 템플릿이 바뀌면 ETag도 바뀌도록 템플릿 수정 시각을 반영
+_ETAG_SALT = max(
+    os.path.getmtime(os.path.join("templates", name))
+    for name in templates.env.list_templates()
+)
+
+def _etag(*parts) -> str:
+    """페이지 데이터로부터 약한 ETag 생성"""
+    digest = hashlib.blake2b(repr((_ETAG_SALT, parts)).encode(), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+def _not_modified(request: Request, etag: str) -> Optional[HTMLResponse]:
+    """If-None-Match가 일치하면 304 응답 반환"""
+    if etag in request.headers.get("if-none-match", ""):
+        return HTMLResponse(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+# 업로드 스트리밍 청크 크기
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# 업로드 임시 디렉터리 (Linux에서는 tmpfs인 /dev/shm 사용)
+UPLOAD_TEMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# 커널 내부 복사(sendfile)로 일반 파일에 쓸 수 있는 플랫폼
+SENDFILE_SUPPORTED = sys.platform.startswith("linux")
+
+def _sendfile(src_fd: int, out_fd: int) -> None:
+    """파일 내용을 사용자 공간 버퍼 없이 커널 내부에서 복사"""
+    size = os.fstat(src_fd).st_size
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(out_fd, src_fd, offset, size - offset)
+        if sent == 0:
+            break
+        offset += sent
+
+async def _stream_to_tempfile(file: UploadFile) -> str:
+    """업로드 파일을 청크 단위로 고유한 임시 파일에 비동기 기록"""
+    fd, temp_path = tempfile.mkstemp(suffix=".pdf", dir=UPLOAD_TEMP_DIR)
+    try:
+        # 이미 디스크로 넘어간 업로드는 sendfile로 복사, 메모리에 있으면 청크 단위로 기록
+        if SENDFILE_SUPPORTED and getattr(file.file, "_rolled", False):
+            with os.fdopen(fd, "wb") as buffer:
+                await asyncio.to_thread(_sendfile, file.file.fileno(), buffer.fileno())
+        else:
+            async with aiofiles.open(fd, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await buffer.write(chunk)
+    except BaseException:
+        await _remove_tempfile(temp_path)
+        raise
+    return temp_path
+
+async def _remove_tempfile(temp_path: str) -> None:
+    """임시 파일을 이벤트 루프를 막지 않고 삭제"""
+    try:
+        await aiofiles.os.remove(temp_path)
+    except FileNotFoundError:
+        pass
+
+async def _handle_pdf_upload(db: AsyncSession, file: UploadFile) -> Union[Dict[str, Any], ORJSONResponse]:
+    """업로드된 PDF를 파싱하여 시험 생성 (일반/관리자 업로드 공용)"""
     if not file.filename.endswith('.pdf'):
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=400,
             content={"success": False, "error": "PDF 파일만 업로드 가능합니다."}
         )
     
+    temp_path = None
     try:
         # 임시 파일로 저장
-        temp_path = f"temp_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # PDF 파싱 및 시험 생성
-        exam = await exam_service.create_exam_from_pdf(temp_path)
+        temp_path = await _stream_to_tempfile(file)
         
-        # 임시 파일 삭제
-        os.remove(temp_path)
+        # PDF 파싱은 CPU 작업이므로 프로세스 풀에서 실행한 뒤 시험 생성
+        exam = await exam_service.create_exam_from_pdf(db, temp_path, app.state.pool)
         
-        # 문제 수를 별도로 조회
-        question_count = await exam_service.get_exam_question_count(exam.id)
-        
-        return JSONResponse(
-            content={
-                "success": True, 
-                "message": f"'{exam.title}' 시험이 성공적으로 업로드되었습니다. (문제 수: {question_count}개)"
-            }
-        )
+        return {
+            "success": True,
+            "message": f"'{exam.title}' 시험이 성공적으로 업로드되었습니다. (문제 수: {exam.total_questions}개)"
+        }
     except Exception as e:
-        # 임시 파일 정리
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={"success": False, "error": f"PDF 파싱 중 오류가 발생했습니다: {str(e)}"}
         )
+    finally:
+        # 임시 파일 정리 (취소된 경우 포함)
+        if temp_path:
+            await _remove_tempfile(temp_path)
+
+# 메인 페이지
+@app.get("/", response_class=HTMLResponse)
+async def index(request: Request):
+    exams = await exam_service.get_all_exams()
+    etag = _etag([(e["id"], e["title"], e["version"], e["description"], e["created_at"]) for e in exams])
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    
+    response = templates.TemplateResponse("index.html", {"request": request, "exams": exams})
+    response.headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    return response
+
+# PDF 업로드
+@app.post("/import/pdf")
+async def import_pdf(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+    return await _handle_pdf_upload(db, file)
 
 # 시험 상세 페이지
 @app.get("/exam/{exam_id}", response_class=HTMLResponse)
 async def exam_detail(request: Request, exam_id: int):
-    exam = await exam_service.get_exam(exam_id)
+    exam = await exam_service.get_exam_with_sections(exam_id)
     if not exam:
         raise HTTPException(status_code=404, detail="시험을 찾을 수 없습니다.")
     
-    sections = await exam_service.get_exam_sections(exam_id)
-    return templates.TemplateResponse("exam_detail.html", {
+    sections = exam.sections
+    etag = _etag(exam.id, exam.title, exam.version, exam.description, exam.created_at, len(sections))
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    
+    response = templates.TemplateResponse("exam_detail.html", {
         "request": request, "exam": exam, "sections": sections
     })
+    response.headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    return response
 
 # 새 세션 생성
 @app.get("/session/new/{exam_id}")
-async def new_session(exam_id: int, mode: str = "exam"):
-    session = await exam_service.create_session(exam_id, mode)
+async def new_session(request: Request, exam_id: int, mode: str = "exam", db: AsyncSession = Depends(get_db)):
+    session = await exam_service.create_session(db, exam_id, mode)
+    
+    # JS 클라이언트에는 JSON으로 응답하여 리다이렉트 왕복 없이 첫 문제로 이동
+    if "application/json" in request.headers.get("accept", ""):
+        first_question = await exam_service.get_first_question(db, session.id)
+        return {
+            "session_id": session.id,
+            "first_question_id": first_question.id if first_question else None
+        }
+    
     return RedirectResponse(url=f"/session/{session.id}")
 
 # 세션 페이지
 @app.get("/session/{session_id}", response_class=HTMLResponse)
-async def session_page(request: Request, session_id: int):
-    session = await exam_service.get_session(session_id)
+async def session_page(request: Request, session_id: int, db: AsyncSession = Depends(get_db)):
+    session = await exam_service.get_session(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="세션을 찾을 수 없습니다.")
     
-    first_question = await exam_service.get_first_question(session_id)
+    first_question = await exam_service.get_first_question(db, session_id)
     if not first_question:
         raise HTTPException(status_code=404, detail="문제를 찾을 수 없습니다.")
     
@@ -109,17 +238,18 @@ async def session_page(request: Request, session_id: int):
 
 # 문제 페이지
 @app.get("/session/{session_id}/question/{question_id}", response_class=HTMLResponse)
-async def question_page(request: Request, session_id: int, question_id: int):
-    session = await exam_service.get_session(session_id)
+async def question_page(request: Request, session_id: int, question_id: int, db: AsyncSession = Depends(get_db)):
+    # 요청의 DB 세션 하나로 차례대로 조회
+    session = await exam_service.get_session(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="세션을 찾을 수 없습니다.")
     
-    question = await exam_service.get_question(question_id)
+    question = await exam_service.get_question(db, question_id)
     if not question:
         raise HTTPException(status_code=404, detail="문제를 찾을 수 없습니다.")
     
-    response = await exam_service.get_response(session_id, question_id)
-    progress = await exam_service.get_session_progress(session_id)
+    response = await exam_service.get_response(db, session_id, question_id)
+    progress = exam_service.get_session_progress(session)
     
     return templates.TemplateResponse("question.html", {
         "request": request,
@@ -136,27 +266,30 @@ async def save_response(
     question_id: int = Form(...),
     choice_id: Optional[int] = Form(None),
     notes: str = Form(""),
-    flagged: bool = Form(False)
+    flagged: bool = Form(False),
+    db: AsyncSession = Depends(get_db)
 ):
-    response = await exam_service.save_response(session_id, question_id, choice_id, notes, flagged)
-    
-    # 세션 정보 조회
-    session = await exam_service.get_session(session_id)
+    # 저장이 커밋된 뒤에 조회하므로 같은 요청에서 저장 결과가 보임
+    response = await exam_service.save_response(db, session_id, question_id, choice_id, notes, flagged)
+    session = await exam_service.get_session(db, session_id)
     
-    # 연습 모드인 경우 즉시 채점 결과만 반환 (정답/오답 여부만)
+    # 연습 모드인 경우 채점 결과와 정답/설명을 함께 반환
     if session.mode == "study":
+        answer = await exam_service.get_question_answer(db, question_id)
         return {
             "success": True,
             "response_id": response.id,
-            "is_correct": bool(response.is_correct)
+            "is_correct": bool(response.is_correct),
+            "correct_answer": answer["correct_answer"],
+            "explanation": answer["explanation"]
         }
     
     return {"success": True, "response_id": response.id}
 
 # 연습 모드에서 정답 확인
 @app.get("/session/{session_id}/question/{question_id}/answer")
-async def get_question_answer(session_id: int, question_id: int):
-    result = await exam_service.get_question_result(session_id, question_id)
+async def get_question_answer(session_id: int, question_id: int, db: AsyncSession = Depends(get_db)):
+    result = await exam_service.get_question_result(db, session_id, question_id)
     return {
         "success": True,
         "is_correct": result["is_correct"],
@@ -166,96 +299,90 @@ async def get_question_answer(session_id: int, question_id: int):
 
 # 세션 제출
 @app.post("/session/{session_id}/submit")
-async def submit_session(session_id: int):
-    session = await exam_service.submit_session(session_id)
+async def submit_session(session_id: int, db: AsyncSession = Depends(get_db)):
+    session = await exam_service.submit_session(db, session_id)
+    # 다시 제출하면 점수가 바뀌므로 이 세션의 캐시된 결과 페이지 제거 (다른 워커의 캐시는 TTL로 만료)
+    for key in [key for key in result_page_cache if key[0] == session_id]:
+        result_page_cache.pop(key, None)
     return RedirectResponse(url=f"/session/{session_id}/result")
 
+# 제출된 세션의 결과 페이지 렌더링 캐시 ((session_id, base_url) -> HTML)
+# 페이지의 정적 파일 링크는 요청의 scheme/host로 만들어지므로 base_url별로 캐시하고,
+# 워커 프로세스마다 따로 있는 캐시라 재제출이 다른 워커에도 반영되도록 짧은 TTL 적용
+RESULT_PAGE_TTL = 60
+result_page_cache: TTLCache = TTLCache(maxsize=1024, ttl=RESULT_PAGE_TTL)
+
 # 결과 페이지
 @app.get("/session/{session_id}/result", response_class=HTMLResponse)
-async def result_page(request: Request, session_id: int):
-    session = await exam_service.get_session(session_id)
+async def result_page(request: Request, session_id: int, db: AsyncSession = Depends(get_db)):
+    cache_key = (session_id, str(request.base_url))
+    cached = result_page_cache.get(cache_key)
+    if cached is not None:
+        return HTMLResponse(cached)
+    
+    session = await exam_service.get_session(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="세션을 찾을 수 없습니다.")
     
     if not session.end_time:
         raise HTTPException(status_code=400, detail="아직 제출되지 않은 세션입니다.")
     
-    return templates.TemplateResponse("result.html", {"request": request, "session": session})
+    # 제출된 세션의 결과는 바뀌지 않으므로 렌더링 결과를 재사용
+    rendered = templates.get_template("result.html").render({"request": request, "session": session})
+    result_page_cache[cache_key] = rendered.encode()
+    return HTMLResponse(rendered)
 
 # Admin 페이지
 @app.get("/admin", response_class=HTMLResponse)
-async def admin_dashboard(request: Request):
-    stats = await exam_service.get_admin_stats()
-    exams = await exam_service.get_all_exams_with_counts()
-    recent_sessions = await exam_service.get_recent_sessions()
+async def admin_dashboard(request: Request, db: AsyncSession = Depends(get_db)):
+    dashboard = await exam_service.get_admin_dashboard(db)
     return templates.TemplateResponse("admin.html", {
-        "request": request, "stats": stats, "exams": exams, "recent_sessions": recent_sessions
+        "request": request,
+        "stats": dashboard["stats"],
+        "exams": dashboard["exams"],
+        "recent_sessions": dashboard["recent_sessions"]
     })
 
 # Admin PDF 업로드
 @app.post("/admin/upload-pdf")
-async def admin_upload_pdf(file: UploadFile = File(...)):
-    if not file.filename.endswith('.pdf'):
-        return JSONResponse(
-            status_code=400,
-            content={"success": False, "error": "PDF 파일만 업로드 가능합니다."}
-        )
-    
-    try:
-        # 임시 파일로 저장
-        temp_path = f"temp_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # PDF 파싱 및 시험 생성
-        exam = await exam_service.create_exam_from_pdf(temp_path)
-        
-        # 임시 파일 삭제
-        os.remove(temp_path)
-        
-        # 문제 수를 별도로 조회
-        question_count = await exam_service.get_exam_question_count(exam.id)
-        
-        return JSONResponse(
-            content={
-                "success": True, 
-                "message": f"'{exam.title}' 시험이 성공적으로 업로드되었습니다. (문제 수: {question_count}개)"
-            }
-        )
-    except Exception as e:
-        # 임시 파일 정리
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        
-        return JSONResponse(
-            status_code=500,
-            content={"success": False, "error": f"PDF 파싱 중 오류가 발생했습니다: {str(e)}"}
-        )
+async def admin_upload_pdf(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+    return await _handle_pdf_upload(db, file)
 
 # 시험 삭제
 @app.delete("/admin/exam/{exam_id}/delete")
-async def delete_exam(exam_id: int):
-    success = await exam_service.delete_exam(exam_id)
+async def delete_exam(exam_id: int, db: AsyncSession = Depends(get_db)):
+    success = await exam_service.delete_exam(db, exam_id)
     if success:
-        return JSONResponse(content={"success": True, "message": "시험이 삭제되었습니다."})
+        return {"success": True, "message": "시험이 삭제되었습니다."}
     else:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={"success": False, "error": "시험 삭제 중 오류가 발생했습니다."}
         )
 
 # 시험 문제 관리
 @app.get("/admin/exam/{exam_id}/questions", response_class=HTMLResponse)
-async def admin_exam_questions(request: Request, exam_id: int):
-    exam = await exam_service.get_exam(exam_id)
+async def admin_exam_questions(request: Request, exam_id: int, db: AsyncSession = Depends(get_db)):
+    # 캐시된 시험 조회는 자체 DB 세션을 쓰므로 요청 세션의 조회와 동시에 실행 가능
+    exam, questions_with_stats = await asyncio.gather(
+        exam_service.get_exam(exam_id),
+        exam_service.get_exam_questions_with_responses(db, exam_id)
+    )
     if not exam:
         raise HTTPException(status_code=404, detail="시험을 찾을 수 없습니다.")
     
-    questions_with_stats = await exam_service.get_exam_questions_with_responses(exam_id)
     return templates.TemplateResponse("admin_questions.html", {
         "request": request, "exam": exam, "questions": questions_with_stats
     })
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    try:
+        # io_uring 기반 이벤트 루프 (Linux 커널 5.11 이상 필요)
+        import uringcore
+        asyncio.set_event_loop_policy(uringcore.EventLoopPolicy())
+        loop = "none"
+    except ImportError:
+        # uvloop이 설치되어 있으면 uvloop 사용
+        loop = "auto"
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop=loop)
@@ -1,13 +1,112 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import MetaData
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import MetaData, event, inspect, text
+import asyncio
+import os
 
 DATABASE_URL = "sqlite+aiosqlite:///./exam_app.db"
-engine = create_async_engine(DATABASE_URL, echo=True)
+POOL_SIZE = 20
+# aiosqlite 파일 DB의 기본 풀은 NullPool이므로 커넥션 풀을 명시적으로 지정
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=bool(os.getenv("SQL_ECHO")),  # SQL 로그는 SQL_ECHO 설정 시에만 출력
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=40,
+    pool_pre_ping=False,  # 로컬 SQLite 파일은 끊기지 않으므로 체크아웃마다 ping할 필요 없음
+    pool_recycle=1800,
+    query_cache_size=1200,  # 컴파일된 SQL 캐시가 밀려나지 않도록 기본값(500)보다 크게
+    connect_args={
+        "check_same_thread": False,
+        "cached_statements": 1024,  # 커넥션별 sqlite3 prepared statement 캐시 (기본 128)
+    }
+)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
 metadata = MetaData()
 
+# 커넥션마다 적용할 SQLite 설정
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",       # 쓰기 중에도 동시 읽기 허용
+    "synchronous=NORMAL",     # WAL에서는 커밋마다 fsync 불필요
+    "cache_size=-65536",      # 페이지 캐시 64MB
+    "mmap_size=268435456",    # 256MB 메모리 맵 I/O
+    "temp_store=MEMORY",      # 임시 테이블/인덱스를 메모리에 저장
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """새 커넥션에 SQLite 성능 설정 적용"""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+# 기존 DB에 추가할 컬럼: (테이블, 컬럼, 컬럼 정의, 기존 행을 채우는 SQL)
+COLUMN_MIGRATIONS = [
+    (
+        "sessions", "answered_count", "INTEGER DEFAULT 0",
+        "UPDATE sessions SET answered_count = ("
+        "SELECT COUNT(*) FROM responses "
+        "WHERE responses.session_id = sessions.id AND responses.selected_choice_id IS NOT NULL)"
+    ),
+    (
+        "exams", "total_questions", "INTEGER DEFAULT 0",
+        "UPDATE exams SET total_questions = ("
+        "SELECT COUNT(*) FROM questions JOIN sections ON questions.section_id = sections.id "
+        "WHERE sections.exam_id = exams.id)"
+    ),
+]
+
+def _add_missing_columns(connection):
+    """create_all은 기존 테이블을 변경하지 않으므로 새 컬럼을 직접 추가"""
+    inspector = inspect(connection)
+    for table, column, definition, backfill in COLUMN_MIGRATIONS:
+        existing = {c["name"] for c in inspector.get_columns(table)}
+        if column not in existing:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+            connection.execute(text(backfill))
+
+# 기존 DB에 유니크 인덱스를 만들기 전에 중복 행을 정리하는 SQL
+INDEX_PREPARATIONS = {
+    # 같은 문제의 응답은 가장 최근 것만 유지
+    "ix_responses_session_question": (
+        "DELETE FROM responses WHERE id NOT IN ("
+        "SELECT MAX(id) FROM responses GROUP BY session_id, question_id)"
+    ),
+    # 정답은 먼저 생성된 것만 유지
+    "ix_answers_question": (
+        "DELETE FROM answers WHERE id NOT IN ("
+        "SELECT MIN(id) FROM answers GROUP BY question_id)"
+    ),
+}
+
+def _add_missing_indexes(connection):
+    """create_all은 기존 테이블에 인덱스를 추가하지 않으므로 없는 인덱스를 직접 생성"""
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                if index.name in INDEX_PREPARATIONS:
+                    connection.execute(text(INDEX_PREPARATIONS[index.name]))
+                index.create(connection)
+
+async def get_db():
+    """요청마다 하나의 DB 세션을 제공하는 FastAPI 의존성"""
+    async with AsyncSessionLocal() as session:
+        yield session
+
+async def warm_pool():
+    """풀의 커넥션을 미리 열어 첫 요청들이 연결/PRAGMA 비용을 치르지 않도록 함"""
+    connections = await asyncio.gather(*(engine.connect() for _ in range(POOL_SIZE)))
+    for connection in connections:
+        await connection.close()
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # 중복 응답 정리(인덱스 준비)가 끝난 뒤에 응답 수를 채우도록 인덱스를 먼저 생성
+        await conn.run_sync(_add_missing_indexes)
+        await conn.run_sync(_add_missing_columns)
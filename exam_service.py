@@ -1,519 +1,617 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, delete, case
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, func, delete, case, update, insert, lambda_stmt, bindparam, RowMapping
+from sqlalchemy.orm import selectinload, raiseload, aliased
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-import json
+from concurrent.futures import Executor
+import asyncio
+
+from async_lru import alru_cache
 
 from database import AsyncSessionLocal
 from models import Exam, Section, Question, Choice, Answer, Session, Response
-from pdf_parser import PDFParser
+from pdf_parser import (
+    PARALLEL_MIN_PAGES, parse_pdf_file, parse_pdf_text,
+    get_page_count, extract_pages, split_page_ranges,
+)
+
+# 응답 일괄 저장 설정
+RESPONSE_BATCH_SIZE = 50         # 한 번에 커밋할 최대 응답 수
+RESPONSE_FLUSH_INTERVAL = 0.005  # 첫 응답 이후 추가 응답을 기다리는 시간(초)
+
+# 목록 조회 시 한 번에 가져올 행 수
+STREAM_BATCH_SIZE = 100
 
+# 문제+선택지 행 수가 이 값 이상이면 드라이버 executemany로 직접 삽입
+BULK_COPY_THRESHOLD = 100
+
+# 요청마다 실행되는 조회문은 lambda_stmt로 만들어 문장 구성과 캐시 키 계산을 건너뜀
+_first_question_stmt = lambda_stmt(
+    lambda: select(Question)
+    .options(raiseload("*"))
+    .join(Section, Question.section_id == Section.id)
+    .where(Section.exam_id == bindparam("exam_id"))
+    .order_by(Question.order_index)
+    .limit(1)
+)
+_response_stmt = lambda_stmt(
+    lambda: select(Response)
+    .options(raiseload("*"))
+    .where(Response.session_id == bindparam("session_id"), Response.question_id == bindparam("question_id"))
+)
+_question_answer_stmt = lambda_stmt(
+    lambda: select(Answer.explanation, Choice.choice_label)
+    .join(Choice, Answer.correct_choice_id == Choice.id)
+    .where(Answer.question_id == bindparam("question_id"))
+)
 class ExamService:
     def __init__(self):
-        self.pdf_parser = PDFParser()
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._write_task: Optional[asyncio.Task] = None
     
-    async def get_all_exams(self) -> List[Exam]:
-        """모든 시험 목록 조회"""
+    @alru_cache(maxsize=256, ttl=30)
+    async def get_all_exams(self) -> List[RowMapping]:
+        """모든 시험 목록 조회 (목록 표시에 필요한 컬럼만)"""
         async with AsyncSessionLocal() as session:
             result = await session.execute(
-                select(Exam).order_by(Exam.created_at.desc())
+                select(Exam.id, Exam.title, Exam.version, Exam.description, Exam.created_at)
+                .order_by(Exam.created_at.desc())
             )
-            return result.scalars().all()
+            return result.mappings().all()
     
+    @alru_cache(maxsize=256, ttl=30)
     async def get_exam(self, exam_id: int) -> Optional[Exam]:
         """특정 시험 조회"""
         async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Exam).where(Exam.id == exam_id)
-            )
-            return result.scalar_one_or_none()
+            return await session.get(Exam, exam_id, options=[raiseload("*")])
     
-    async def get_exam_sections(self, exam_id: int) -> List[Section]:
-        """시험의 섹션 목록 조회"""
+    @alru_cache(maxsize=256, ttl=30)
+    async def get_exam_with_sections(self, exam_id: int) -> Optional[Exam]:
+        """시험과 섹션 목록을 함께 조회 (sections 로드)"""
         async with AsyncSessionLocal() as session:
             result = await session.execute(
-                select(Section)
-                .where(Section.exam_id == exam_id)
-                .order_by(Section.order_index)
+                select(Exam)
+                .options(selectinload(Exam.sections), raiseload("*"))
+                .where(Exam.id == exam_id)
             )
-            return result.scalars().all()
+            return result.scalar_one_or_none()
+    
+    async def warm_statements(self, session: AsyncSession):
+        """모듈 수준 lambda_stmt를 없는 ID로 한 번씩 실행해 SQL 컴파일 캐시를 미리 채움"""
+        await session.execute(_first_question_stmt, {"exam_id": -1})
+        await session.execute(_response_stmt, {"session_id": -1, "question_id": -1})
+        await session.execute(_question_answer_stmt, {"question_id": -1})
+    
+    def _invalidate_exam_cache(self):
+        """시험 목록/상세 캐시 무효화"""
+        self.get_all_exams.cache_clear()
+        self.get_exam.cache_clear()
+        self.get_exam_with_sections.cache_clear()
     
-    async def create_exam_from_pdf(self, pdf_path: str) -> Exam:
+    async def create_exam_from_pdf(self, session: AsyncSession, pdf_path: str, executor: Optional[Executor] = None) -> Exam:
         """PDF에서 시험 데이터 생성"""
-        # PDF 파싱
-        parsed_data = self.pdf_parser.parse_pdf(pdf_path)
+        # PDF 파싱은 CPU 작업이므로 이벤트 루프 밖에서 실행 (기본은 스레드 풀, 프로세스 풀 지정 가능)
+        loop = asyncio.get_running_loop()
+        page_count = await asyncio.to_thread(get_page_count, pdf_path) if executor is not None else 0
+        if page_count >= PARALLEL_MIN_PAGES:
+            # 큰 PDF는 페이지 구간별로 나눠 풀의 여러 프로세스에서 동시에 텍스트 추출
+            texts = await asyncio.gather(*(
+                loop.run_in_executor(executor, extract_pages, pdf_path, start, end)
+                for start, end in split_page_ranges(page_count)
+            ))
+            parsed_data = await loop.run_in_executor(executor, parse_pdf_text, "".join(texts))
+        else:
+            parsed_data = await loop.run_in_executor(executor, parse_pdf_file, pdf_path)
+        return await self.create_exam(session, parsed_data)
+    
+    async def create_exam(self, session: AsyncSession, parsed_data: Dict[str, Any]) -> Exam:
+        """파싱된 데이터로 시험 생성"""
+        # 시험 생성
+        exam = Exam(
+            title=parsed_data["exam_info"]["title"],
+            version=parsed_data["exam_info"]["version"],
+            description=parsed_data["exam_info"]["description"],
+            total_questions=len(parsed_data["questions"])
+        )
+        session.add(exam)
+        await session.flush()
         
-        async with AsyncSessionLocal() as session:
-            # 시험 생성
-            exam = Exam(
-                title=parsed_data["exam_info"]["title"],
-                version=parsed_data["exam_info"]["version"],
-                description=parsed_data["exam_info"]["description"]
-            )
-            session.add(exam)
-            await session.flush()
-            
-            # 기본 섹션 생성
-            section = Section(
-                exam_id=exam.id,
-                title="기본 섹션",
-                order_index=0
-            )
-            session.add(section)
-            await session.flush()
-            
-            # 문제들 생성
-            for i, question_data in enumerate(parsed_data["questions"]):
-                question = Question(
-                    section_id=section.id,
-                    question_text=question_data["question_text"],
-                    order_index=i,
-                    images=json.dumps(question_data["images"])
-                )
-                session.add(question)
-                await session.flush()
-                
-                # 선택지들 생성
-                choices = []
-                for choice_data in question_data["choices"]:
-                    choice = Choice(
-                        question_id=question.id,
-                        choice_text=choice_data["text"],
-                        choice_label=choice_data["label"],
-                        order_index=choice_data["order_index"]
-                    )
-                    session.add(choice)
-                    await session.flush()  # ID 생성을 위해 flush
-                    choices.append(choice)
-                
-                # 답안 생성
-                if question_data["answer"]:
-                    # 정답 선택지 찾기
-                    correct_choice = None
-                    for choice in choices:
-                        if choice.choice_label == question_data["answer"]:
-                            correct_choice = choice
-                            break
-                    
-                    if correct_choice:
-                        answer = Answer(
-                            question_id=question.id,
-                            correct_choice_id=correct_choice.id,
-                            explanation=question_data["explanation"]
-                        )
-                        session.add(answer)
+        # 기본 섹션 생성
+        section = Section(
+            exam_id=exam.id,
+            title="기본 섹션",
+            order_index=0
+        )
+        session.add(section)
+        await session.flush()
+        
+        await self._insert_questions(session, section.id, parsed_data["questions"])
+        
+        await session.commit()
+        self._invalidate_exam_cache()
+        
+        # Exam 객체를 다시 조회하여 반환 (세션에 바인딩된 객체)
+        result = await session.execute(
+            select(Exam).options(selectinload(Exam.sections), raiseload("*")).where(Exam.id == exam.id)
+        )
+        return result.scalar_one()
+    
+    async def _insert_questions(self, session: AsyncSession, section_id: int, questions_data: List[Dict[str, Any]]):
+        """ID를 미리 할당해 문제/선택지/답안을 flush 없이 일괄 삽입"""
+        choice_count = sum(len(question_data["choices"]) for question_data in questions_data)
+        question_ids = await self._alloc_ids(session, Question, len(questions_data))
+        choice_ids = iter(await self._alloc_ids(session, Choice, choice_count))
+        
+        question_rows, choice_rows, answer_rows = [], [], []
+        for i, (question_id, question_data) in enumerate(zip(question_ids, questions_data)):
+            question_rows.append((question_id, section_id, question_data["question_text"], i, question_data["images"]))
             
-            await session.commit()
+            correct_choice_id = None
+            for choice_data in question_data["choices"]:
+                choice_id = next(choice_ids)
+                choice_rows.append((choice_id, question_id, choice_data["text"], choice_data["label"], choice_data["order_index"]))
+                # 같은 라벨이 여러 개면 첫 번째 선택지를 정답으로 사용
+                if correct_choice_id is None and question_data["answer"] and choice_data["label"] == question_data["answer"]:
+                    correct_choice_id = choice_id
             
-            # Exam 객체를 다시 조회하여 반환 (세션에 바인딩된 객체)
-            result = await session.execute(
-                select(Exam).options(selectinload(Exam.sections)).where(Exam.id == exam.id)
-            )
-            return result.scalar_one()
+            if correct_choice_id is not None:
+                answer_rows.append((question_id, correct_choice_id, question_data["explanation"]))
+        
+        # 대량 데이터는 ORM을 거치지 않고 드라이버로 직접 삽입
+        insert_rows = self._bulk_copy if len(question_rows) + len(choice_rows) >= BULK_COPY_THRESHOLD else self._bulk_insert
+        await insert_rows(session, Question.__table__, ("id", "section_id", "question_text", "order_index", "images"), question_rows)
+        await insert_rows(session, Choice.__table__, ("id", "question_id", "choice_text", "choice_label", "order_index"), choice_rows)
+        await insert_rows(session, Answer.__table__, ("question_id", "correct_choice_id", "explanation"), answer_rows)
     
-    async def create_session(self, exam_id: int, mode: str = "exam") -> Session:
+    async def _alloc_ids(self, session: AsyncSession, model, n: int) -> range:
+        """테이블에 사용할 연속 ID n개 할당"""
+        # 시험/섹션을 flush하며 쓰기 잠금을 잡았으므로 커밋 전까지 다른 쓰기와 겹치지 않음
+        result = await session.execute(select(func.coalesce(func.max(model.id), 0) + 1))
+        start = result.scalar()
+        return range(start, start + n)
+    
+    async def _bulk_insert(self, session: AsyncSession, table, columns: tuple, rows: List[tuple]):
+        """Core insert를 executemany로 실행"""
+        if rows:
+            await session.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+    
+    async def _bulk_copy(self, session: AsyncSession, table, columns: tuple, rows: List[tuple]):
+        """SQL 컴파일과 파라미터 변환 없이 드라이버 커넥션에서 바로 executemany 실행"""
+        if not rows:
+            return
+        conn = await session.connection()
+        raw = await conn.get_raw_connection()
+        # 드라이버에 직접 넘기므로 JSON 등 컬럼 타입의 값 변환을 여기서 적용
+        processors = [table.c[column].type.bind_processor(conn.dialect) for column in columns]
+        if any(processors):
+            rows = [
+                tuple(process(value) if process else value for process, value in zip(processors, row))
+                for row in rows
+            ]
+        placeholders = ", ".join("?" for _ in columns)
+        await raw.driver_connection.executemany(
+            f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({placeholders})",
+            rows
+        )
+    
+    async def create_session(self, session: AsyncSession, exam_id: int, mode: str = "exam") -> Session:
         """새로운 시험 세션 생성"""
-        async with AsyncSessionLocal() as session:
-            # 총 문제 수 계산
-            result = await session.execute(
-                select(func.count(Question.id))
-                .join(Section, Question.section_id == Section.id)
-                .where(Section.exam_id == exam_id)
-            )
-            total_questions = result.scalar()
-            
-            # 세션 생성
-            exam_session = Session(
+        # 총 문제 수는 시험 생성 시 저장된 값을 서브쿼리로 채우고, 기본값은 RETURNING으로 받음
+        result = await session.execute(
+            insert(Session)
+            .values(
                 exam_id=exam_id,
                 mode=mode,
-                total_questions=total_questions
+                total_questions=func.coalesce(
+                    select(Exam.total_questions).where(Exam.id == exam_id).scalar_subquery(), 0
+                )
             )
-            session.add(exam_session)
-            await session.commit()
-            await session.refresh(exam_session)
-            
-            return exam_session
+            .returning(Session)
+        )
+        exam_session = result.scalar_one()
+        await session.commit()
+        
+        return exam_session
+    
+    async def get_session(self, session: AsyncSession, session_id: int) -> Optional[Session]:
+        """세션 조회 (exam 로드)"""
+        return await session.get(Session, session_id, options=[selectinload(Session.exam), raiseload("*")])
     
-    async def get_session(self, session_id: int) -> Optional[Session]:
-        """세션 조회"""
+    @alru_cache(maxsize=10_000)
+    async def _cached_exam_id(self, session_id: int) -> Optional[int]:
+        """세션의 시험 ID 조회 (_exam_id_for_session을 통해 사용)"""
         async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Session).options(selectinload(Session.exam)).where(Session.id == session_id)
-            )
+            result = await session.execute(select(Session.exam_id).where(Session.id == session_id))
             return result.scalar_one_or_none()
     
-    async def get_first_question(self, session_id: int) -> Optional[Question]:
+    async def _exam_id_for_session(self, session_id: int) -> Optional[int]:
+        """세션의 시험 ID (세션이 살아 있는 동안 바뀌지 않으므로 캐시)"""
+        exam_id = await self._cached_exam_id(session_id)
+        if exam_id is None:
+            # 아직 없는 세션 ID가 캐시에 남지 않도록 제거
+            self._cached_exam_id.cache_invalidate(session_id)
+        return exam_id
+    
+    def _question_order(self, exam_id, question_id: int):
+        """시험에 속한 문제의 순서 서브쿼리 (다른 시험의 문제면 NULL)"""
+        current_question = aliased(Question)
+        current_section = aliased(Section)
+        return (
+            select(current_question.order_index)
+            .join(current_section, current_question.section_id == current_section.id)
+            .where(current_question.id == question_id, current_section.exam_id == exam_id)
+            .scalar_subquery()
+        )
+    
+    async def get_first_question(self, session: AsyncSession, session_id: int) -> Optional[Question]:
         """세션의 첫 번째 문제 조회"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Question)
-                .join(Section, Question.section_id == Section.id)
-                .join(Exam, Section.exam_id == Exam.id)
-                .join(Session, Exam.id == Session.exam_id)
-                .where(Session.id == session_id)
-                .order_by(Question.order_index)
-                .limit(1)
-            )
-            return result.scalar_one_or_none()
+        exam_id = await self._exam_id_for_session(session_id)
+        if exam_id is None:
+            return None
+        result = await session.execute(_first_question_stmt, {"exam_id": exam_id})
+        return result.scalar_one_or_none()
     
-    async def get_question(self, question_id: int) -> Optional[Question]:
-        """특정 문제 조회"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Question)
-                .options(selectinload(Question.choices))
-                .where(Question.id == question_id)
-            )
-            return result.scalar_one_or_none()
+    async def get_question(self, session: AsyncSession, question_id: int) -> Optional[Question]:
+        """특정 문제 조회 (choices 로드)"""
+        return await session.get(Question, question_id, options=[selectinload(Question.choices), raiseload("*")])
     
-    async def get_response(self, session_id: int, question_id: int) -> Optional[Response]:
+    async def get_response(self, session: AsyncSession, session_id: int, question_id: int) -> Optional[Response]:
         """특정 문제의 응답 조회"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Response)
-                .where(Response.session_id == session_id, Response.question_id == question_id)
-            )
-            return result.scalar_one_or_none()
+        result = await session.execute(_response_stmt, {"session_id": session_id, "question_id": question_id})
+        return result.scalar_one_or_none()
     
-    async def save_response(self, session_id: int, question_id: int, choice_id: Optional[int], notes: str = "", flagged: bool = False) -> Response:
-        """응답 저장"""
-        async with AsyncSessionLocal() as db:
-            # 기존 응답 확인
-            existing_response = await self.get_response(session_id, question_id)
-            
-            def is_choice_correct(choice_id, answer):
+    async def save_response(self, session: AsyncSession, session_id: int, question_id: int, choice_id: Optional[int], notes: str = "", flagged: bool = False) -> Response:
+        """응답 저장 (쓰기 작업자가 실행 중이면 다른 요청과 묶어서 작업자의 DB 세션에서 한 번에 커밋)"""
+        item = (session_id, question_id, choice_id, notes, flagged)
+        if self._write_task is None:
+            response, = await self._apply_responses(session, [item])
+            await session.commit()
+            return response
+        
+        # 커밋이 끝난 뒤에 결과를 받으므로 저장 직후 조회해도 변경 사항이 보임
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((item, future))
+        return await future
+    
+    async def start_response_writer(self):
+        """응답 일괄 저장 작업자 시작"""
+        if self._write_task is None:
+            self._write_queue = asyncio.Queue()
+            self._write_task = asyncio.create_task(self._response_write_loop())
+    
+    async def stop_response_writer(self):
+        """대기 중인 응답을 모두 저장한 뒤 작업자 종료"""
+        if self._write_task is None:
+            return
+        await self._write_queue.join()
+        self._write_task.cancel()
+        try:
+            await self._write_task
+        except asyncio.CancelledError:
+            pass
+        self._write_task = None
+    
+    async def _response_write_loop(self):
+        """큐에 쌓인 응답을 최대 RESPONSE_BATCH_SIZE개 또는 RESPONSE_FLUSH_INTERVAL초 단위로 묶어 저장"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._write_queue.get()]
+            deadline = loop.time() + RESPONSE_FLUSH_INTERVAL
+            while len(batch) < RESPONSE_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
                 try:
-                    if not choice_id or str(choice_id).strip() == "":
-                        print(f"[DEBUG] choice_id is None or empty: {choice_id}")
-                        return False
-                    cid = int(choice_id)
-                    acid = int(answer.correct_choice_id)
-                    print(f"[DEBUG] 비교: 선택={cid}, 정답={acid}")
-                    return cid == acid
-                except Exception as e:
-                    print(f"[DEBUG] 비교 오류: {e}, choice_id={choice_id}, answer.correct_choice_id={getattr(answer, 'correct_choice_id', None)}")
-                    return False
+                    batch.append(await asyncio.wait_for(self._write_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
             
-            if existing_response:
-                # 기존 응답 업데이트
-                existing_response.selected_choice_id = choice_id
-                existing_response.notes = notes
-                existing_response.flagged = flagged
-                existing_response.response_time = datetime.now()
-                
-                # 정답 여부 확인
-                if choice_id:
-                    result = await db.execute(
-                        select(Answer).where(Answer.question_id == question_id)
-                    )
-                    answer = result.scalar_one_or_none()
-                    if answer:
-                        existing_response.is_correct = is_choice_correct(choice_id, answer)
-                
-                await db.commit()
-                return existing_response
+            try:
+                async with AsyncSessionLocal() as db:
+                    responses = await self._apply_responses(db, [item for item, _ in batch])
+                    await db.commit()
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
             else:
-                # 새 응답 생성
-                is_correct = None
-                if choice_id:
-                    result = await db.execute(
-                        select(Answer).where(Answer.question_id == question_id)
-                    )
-                    answer = result.scalar_one_or_none()
-                    if answer:
-                        is_correct = is_choice_correct(choice_id, answer)
-                
-                response = Response(
-                    session_id=session_id,
-                    question_id=question_id,
-                    selected_choice_id=choice_id,
-                    is_correct=is_correct,
-                    notes=notes,
-                    flagged=flagged
-                )
-                db.add(response)
-                await db.commit()
-                await db.refresh(response)
-                return response
+                for (_, future), response in zip(batch, responses):
+                    if not future.done():
+                        future.set_result(response)
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
     
-    async def submit_session(self, session_id: int) -> Session:
-        """세션 제출 및 점수 계산"""
-        async with AsyncSessionLocal() as session:
-            # 세션 조회
-            result = await session.execute(
-                select(Session).where(Session.id == session_id)
-            )
-            exam_session = result.scalar_one_or_none()
-            
-            if not exam_session:
-                raise ValueError("Session not found")
+    async def _apply_responses(self, db: AsyncSession, items: List[tuple]) -> List[Response]:
+        """응답들을 다중 행 UPSERT로 추가/수정 (커밋은 호출자가 수행)"""
+        # 한 문장 안에서 같은 문제가 두 번 나오지 않도록 나눠서 순서대로 실행
+        rounds: List[Dict[tuple, tuple]] = []
+        for item in items:
+            key = item[:2]
+            for pending in rounds:
+                if key not in pending:
+                    pending[key] = item
+                    break
+            else:
+                rounds.append({key: item})
+        
+        saved: Dict[tuple, Response] = {}
+        for pending in rounds:
+            stmt = sqlite_insert(Response).values([
+                {
+                    "session_id": session_id,
+                    "question_id": question_id,
+                    "selected_choice_id": choice_id,
+                    # 정답 여부는 answers를 참조하는 서브쿼리로 DB에서 계산 (답안이나 정답이 없으면 NULL)
+                    "is_correct": None if choice_id is None else (
+                        select(Answer.correct_choice_id == choice_id)
+                        .where(Answer.question_id == question_id)
+                        .scalar_subquery()
+                    ),
+                    "notes": notes,
+                    "flagged": flagged
+                }
+                for session_id, question_id, choice_id, notes, flagged in pending.values()
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Response.session_id, Response.question_id],
+                set_={
+                    "selected_choice_id": stmt.excluded.selected_choice_id,
+                    "notes": stmt.excluded.notes,
+                    "flagged": stmt.excluded.flagged,
+                    "response_time": datetime.now(),
+                    # 답안을 지웠거나 정답 정보가 없으면 기존 채점 결과 유지
+                    "is_correct": case(
+                        (stmt.excluded.selected_choice_id.isnot(None),
+                         func.coalesce(stmt.excluded.is_correct, Response.is_correct)),
+                        else_=Response.is_correct
+                    )
+                }
+            ).returning(Response)
             
-            # 정답 수 계산
-            result = await session.execute(
-                select(func.count(Response.id))
-                .where(Response.session_id == session_id, Response.is_correct == True)
+            result = await db.execute(stmt, execution_options={"populate_existing": True})
+            for response in result.scalars():
+                saved[(response.session_id, response.question_id)] = response
+        
+        await self._refresh_answered_count(db, {session_id for session_id, *_ in items})
+        return [saved[item[:2]] for item in items]
+    
+    async def _refresh_answered_count(self, db: AsyncSession, session_ids: set):
+        """세션들의 응답 수를 답안이 선택된 응답 수로 다시 계산"""
+        await db.execute(
+            update(Session)
+            .where(Session.id.in_(session_ids))
+            .values(
+                answered_count=select(func.count(Response.id))
+                .where(Response.session_id == Session.id, Response.selected_choice_id.isnot(None))
+                .scalar_subquery()
             )
-            correct_answers = result.scalar()
-            
-            # 점수 계산
-            score = (correct_answers / exam_session.total_questions * 100) if exam_session.total_questions > 0 else 0
-            
-            # 세션 업데이트
-            exam_session.end_time = datetime.now()
-            exam_session.score = score
-            exam_session.correct_answers = correct_answers
-            
-            await session.commit()
-            await session.refresh(exam_session)
-            
-            return exam_session
+        )
     
-    async def get_session_questions(self, session_id: int) -> List[Question]:
+    async def submit_session(self, session: AsyncSession, session_id: int) -> Session:
+        """세션 제출 및 점수 계산"""
+        # 총 문제 수와 정답 수를 한 번에 조회
+        result = await session.execute(
+            select(Session.total_questions, func.count(case((Response.is_correct == True, 1))))
+            .outerjoin(Response, Response.session_id == Session.id)
+            .where(Session.id == session_id)
+            .group_by(Session.id)
+        )
+        row = result.first()
+        
+        if not row:
+            raise ValueError("Session not found")
+        total_questions, correct_answers = row
+        
+        # 점수 계산
+        score = (correct_answers / total_questions * 100) if total_questions > 0 else 0
+        
+        # 세션 업데이트 후 갱신된 행을 RETURNING으로 받음
+        result = await session.execute(
+            update(Session)
+            .where(Session.id == session_id)
+            .values(end_time=datetime.now(), score=score, correct_answers=correct_answers)
+            .returning(Session),
+            execution_options={"populate_existing": True}
+        )
+        exam_session = result.scalar_one()
+        await session.commit()
+        # 제출된 세션은 더 이상 문제를 탐색하지 않으므로 캐시에서 제거
+        self._cached_exam_id.cache_invalidate(session_id)
+        
+        return exam_session
+    
+    async def get_session_questions(self, session: AsyncSession, session_id: int) -> List[Question]:
         """세션의 모든 문제 조회"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Question)
-                .join(Section, Question.section_id == Section.id)
-                .join(Exam, Section.exam_id == Exam.id)
-                .join(Session, Exam.id == Session.exam_id)
-                .where(Session.id == session_id)
-                .order_by(Question.order_index)
-            )
-            return result.scalars().all()
+        exam_id = await self._exam_id_for_session(session_id)
+        if exam_id is None:
+            return []
+        # 결과를 나눠 받으면서 이벤트 루프에 양보
+        result = await session.stream_scalars(
+            select(Question)
+            .options(raiseload("*"))
+            .join(Section, Question.section_id == Section.id)
+            .where(Section.exam_id == exam_id)
+            .order_by(Question.order_index)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        return [question async for question in result]
     
-    async def get_next_question(self, session_id: int, current_question_id: int) -> Optional[Question]:
+    async def get_next_question(self, session: AsyncSession, session_id: int, current_question_id: int) -> Optional[Question]:
         """다음 문제 조회"""
-        async with AsyncSessionLocal() as session:
-            # 현재 문제의 순서 찾기
-            result = await session.execute(
-                select(Question.order_index)
-                .join(Section, Question.section_id == Section.id)
-                .join(Exam, Section.exam_id == Exam.id)
-                .join(Session, Exam.id == Session.exam_id)
-                .where(Session.id == session_id, Question.id == current_question_id)
-            )
-            current_order = result.scalar_one_or_none()
-            
-            if current_order is None:
-                return None
-            
-            # 다음 문제 조회
-            result = await session.execute(
-                select(Question)
-                .join(Section, Question.section_id == Section.id)
-                .join(Exam, Section.exam_id == Exam.id)
-                .join(Session, Exam.id == Session.exam_id)
-                .where(Session.id == session_id, Question.order_index > current_order)
-                .order_by(Question.order_index)
-                .limit(1)
-            )
-            return result.scalar_one_or_none()
+        exam_id = await self._exam_id_for_session(session_id)
+        if exam_id is None:
+            return None
+        result = await session.execute(
+            select(Question)
+            .options(raiseload("*"))
+            .join(Section, Question.section_id == Section.id)
+            .where(Section.exam_id == exam_id, Question.order_index > self._question_order(exam_id, current_question_id))
+            .order_by(Question.order_index)
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
     
-    async def get_previous_question(self, session_id: int, current_question_id: int) -> Optional[Question]:
+    async def get_previous_question(self, session: AsyncSession, session_id: int, current_question_id: int) -> Optional[Question]:
         """이전 문제 조회"""
-        async with AsyncSessionLocal() as session:
-            # 현재 문제의 순서 찾기
-            result = await session.execute(
-                select(Question.order_index)
-                .join(Section, Question.section_id == Section.id)
-                .join(Exam, Section.exam_id == Exam.id)
-                .join(Session, Exam.id == Session.exam_id)
-                .where(Session.id == session_id, Question.id == current_question_id)
-            )
-            current_order = result.scalar_one_or_none()
-            
-            if current_order is None:
-                return None
-            
-            # 이전 문제 조회
-            result = await session.execute(
-                select(Question)
-                .join(Section, Question.section_id == Section.id)
-                .join(Exam, Section.exam_id == Exam.id)
-                .join(Session, Exam.id == Session.exam_id)
-                .where(Session.id == session_id, Question.order_index < current_order)
-                .order_by(Question.order_index.desc())
-                .limit(1)
-            )
-            return result.scalar_one_or_none()
+        exam_id = await self._exam_id_for_session(session_id)
+        if exam_id is None:
+            return None
+        result = await session.execute(
+            select(Question)
+            .options(raiseload("*"))
+            .join(Section, Question.section_id == Section.id)
+            .where(Section.exam_id == exam_id, Question.order_index < self._question_order(exam_id, current_question_id))
+            .order_by(Question.order_index.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
     
-    async def get_session_progress(self, session_id: int) -> Dict[str, Any]:
-        """세션 진행 상황 조회"""
-        async with AsyncSessionLocal() as session:
-            # 총 응답 수
-            result = await session.execute(
-                select(func.count(Response.id))
-                .where(Response.session_id == session_id)
-            )
-            answered_count = result.scalar()
-            
-            # 정답 수
-            result = await session.execute(
-                select(func.count(Response.id))
-                .where(Response.session_id == session_id, Response.is_correct == True)
-            )
-            correct_count = result.scalar()
-            
-            # 세션 정보
-            result = await session.execute(
-                select(Session).where(Session.id == session_id)
-            )
-            exam_session = result.scalar_one_or_none()
-            
-            if not exam_session:
-                return {}
-            
-            return {
-                "total_questions": exam_session.total_questions,
-                "answered_count": answered_count,
-                "correct_count": correct_count,
-                "progress_percentage": (answered_count / exam_session.total_questions * 100) if exam_session.total_questions > 0 else 0
-            }
+    def get_session_progress(self, exam_session: Session) -> Dict[str, Any]:
+        """세션 진행 상황 (이미 조회한 세션의 카운터로 계산하므로 추가 쿼리 없음)"""
+        answered_count = exam_session.answered_count
+        total_questions = exam_session.total_questions
+        
+        return {
+            "total_questions": total_questions,
+            "answered_count": answered_count,
+            "progress_percentage": (answered_count / total_questions * 100) if total_questions > 0 else 0
+        }
+    
+    async def get_question_answer(self, session: AsyncSession, question_id: int) -> Dict[str, Any]:
+        """문제의 정답 선택지와 설명 조회"""
+        result = await session.execute(_question_answer_stmt, {"question_id": question_id})
+        answer_info = result.first()
+        
+        if not answer_info:
+            return {"correct_answer": None, "explanation": None}
+        
+        return {
+            "correct_answer": answer_info.choice_label,
+            "explanation": answer_info.explanation
+        }
     
-    async def get_question_result(self, session_id: int, question_id: int) -> Dict[str, Any]:
+    async def get_question_result(self, session: AsyncSession, session_id: int, question_id: int) -> Dict[str, Any]:
         """문제 결과 조회 (연습 모드용)"""
-        async with AsyncSessionLocal() as session:
-            # 응답 조회
-            result = await session.execute(
-                select(Response)
-                .where(Response.session_id == session_id, Response.question_id == question_id)
-            )
-            response = result.scalar_one_or_none()
-            
-            if not response:
-                return {
-                    "is_correct": None,
-                    "correct_answer": None,
-                    "explanation": None
-                }
-            
-            # 정답 정보 조회
-            result = await session.execute(
-                select(Answer, Choice.choice_label)
-                .join(Choice, Answer.correct_choice_id == Choice.id)
-                .where(Answer.question_id == question_id)
-            )
-            answer_info = result.first()
-            
-            if not answer_info:
-                return {
-                    "is_correct": None,
-                    "correct_answer": None,
-                    "explanation": None
-                }
-            
-            answer, correct_choice_label = answer_info
-            
+        # 응답과 정답 정보를 한 번에 조회 (둘 중 하나라도 없으면 결과 없음)
+        result = await session.execute(
+            select(Response.is_correct, Choice.choice_label, Answer.explanation)
+            .select_from(Response)
+            .join(Answer, Answer.question_id == Response.question_id)
+            .join(Choice, Answer.correct_choice_id == Choice.id)
+            .where(Response.session_id == session_id, Response.question_id == question_id)
+        )
+        row = result.first()
+        
+        if not row:
             return {
-                "is_correct": response.is_correct,
-                "correct_answer": correct_choice_label,
-                "explanation": answer.explanation
+                "is_correct": None,
+                "correct_answer": None,
+                "explanation": None
             }
+        
+        return {
+            "is_correct": row.is_correct,
+            "correct_answer": row.choice_label,
+            "explanation": row.explanation
+        }
     
     # Admin 기능들
-    async def get_admin_stats(self) -> Dict[str, Any]:
-        """관리자 통계 조회"""
-        async with AsyncSessionLocal() as session:
-            # 총 시험 수
-            result = await session.execute(select(func.count(Exam.id)))
-            total_exams = result.scalar()
-            
-            # 총 문제 수
-            result = await session.execute(select(func.count(Question.id)))
-            total_questions = result.scalar()
-            
-            # 총 세션 수
-            result = await session.execute(select(func.count(Session.id)))
-            total_sessions = result.scalar()
-            
-            # 평균 점수
-            result = await session.execute(
+    async def get_admin_dashboard(self, session: AsyncSession, recent_limit: int = 10) -> Dict[str, Any]:
+        """관리자 대시보드 데이터를 하나의 DB 세션에서 조회"""
+        return {
+            "stats": await self._fetch_admin_stats(session),
+            "exams": await self._fetch_exams_with_counts(session),
+            "recent_sessions": await self._fetch_recent_sessions(session, recent_limit)
+        }
+    
+    async def _fetch_admin_stats(self, session: AsyncSession) -> Dict[str, Any]:
+        """시험/문제/세션 수와 평균 점수를 하나의 쿼리로 집계"""
+        result = await session.execute(
+            select(
+                select(func.count(Exam.id)).scalar_subquery().label('total_exams'),
+                select(func.count(Question.id)).scalar_subquery().label('total_questions'),
+                select(func.count(Session.id)).scalar_subquery().label('total_sessions'),
                 select(func.avg(Session.score))
                 .where(Session.score.isnot(None))
+                .scalar_subquery().label('avg_score')
             )
-            avg_score = result.scalar() or 0
-            
-            return {
-                "total_exams": total_exams,
-                "total_questions": total_questions,
-                "total_sessions": total_sessions,
-                "avg_score": round(avg_score, 2)
-            }
+        )
+        row = result.one()
+        
+        return {
+            "total_exams": row.total_exams,
+            "total_questions": row.total_questions,
+            "total_sessions": row.total_sessions,
+            "avg_score": round(row.avg_score or 0, 2)
+        }
     
-    async def get_all_exams_with_counts(self) -> List[Dict[str, Any]]:
-        """모든 시험과 문제 수 조회"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(
-                    Exam,
-                    func.count(Question.id).label('question_count')
-                )
-                .select_from(Exam)
-                .outerjoin(Section, Exam.id == Section.exam_id)
-                .outerjoin(Question, Section.id == Question.section_id)
-                .group_by(Exam.id)
-                .order_by(Exam.created_at.desc())
+    async def _fetch_exams_with_counts(self, session: AsyncSession) -> List[Dict[str, Any]]:
+        """시험별 문제 수 조회"""
+        result = await session.stream(
+            select(
+                Exam.id,
+                Exam.title,
+                Exam.version,
+                Exam.description,
+                Exam.created_at,
+                Exam.total_questions.label('question_count')
             )
-            return [{"exam": row[0], "question_count": row[1]} for row in result.all()]
+            .order_by(Exam.created_at.desc())
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        return [row async for row in result.mappings()]
     
-    async def get_recent_sessions(self, limit: int = 10) -> List[Session]:
+    async def _fetch_recent_sessions(self, session: AsyncSession, limit: int) -> List[RowMapping]:
         """최근 세션 조회"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Session)
-                .options(selectinload(Session.exam))
-                .order_by(Session.start_time.desc())
-                .limit(limit)
+        result = await session.execute(
+            select(
+                Session.id,
+                Session.mode,
+                Session.score,
+                Session.start_time,
+                Exam.title.label('exam_title')
             )
-            return result.scalars().all()
+            .outerjoin(Exam, Session.exam_id == Exam.id)
+            .order_by(Session.start_time.desc())
+            .limit(limit)
+        )
+        return result.mappings().all()
     
-    async def delete_exam(self, exam_id: int) -> bool:
+    async def delete_exam(self, session: AsyncSession, exam_id: int) -> bool:
         """시험 삭제"""
-        async with AsyncSessionLocal() as session:
-            try:
-                result = await session.execute(
-                    delete(Exam).where(Exam.id == exam_id)
-                )
-                await session.commit()
-                return result.rowcount > 0
-            except Exception:
-                await session.rollback()
-                return False
-    
-    async def get_exam_question_count(self, exam_id: int) -> int:
-        """시험의 문제 수 조회"""
-        async with AsyncSessionLocal() as session:
+        try:
             result = await session.execute(
-                select(func.count(Question.id))
-                .select_from(Question)
-                .join(Section, Question.section_id == Section.id)
-                .where(Section.exam_id == exam_id)
+                delete(Exam).where(Exam.id == exam_id)
             )
-            return result.scalar()
+            await session.commit()
+            self._invalidate_exam_cache()
+            return result.rowcount > 0
+        except Exception:
+            await session.rollback()
+            return False
     
-    async def get_exam_questions_with_responses(self, exam_id: int) -> List[Dict[str, Any]]:
+    async def get_exam_questions_with_responses(self, session: AsyncSession, exam_id: int) -> List[Dict[str, Any]]:
         """시험의 문제들과 응답 통계 조회"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(
-                    Question,
-                    func.count(Response.id).label('response_count'),
-                    func.count(case((Response.is_correct == True, 1))).label('correct_count')
-                )
-                .select_from(Question)
-                .join(Section, Question.section_id == Section.id)
-                .outerjoin(Response, Question.id == Response.question_id)
-                .where(Section.exam_id == exam_id)
-                .group_by(Question.id)
-                .order_by(Question.order_index)
+        result = await session.stream(
+            select(
+                Question.id,
+                Question.order_index,
+                Question.question_text,
+                func.count(Response.id).label('response_count'),
+                func.count(case((Response.is_correct == True, 1))).label('correct_count'),
+                func.avg(case((Response.is_correct == True, 1), else_=0)).label('accuracy')
             )
-            return [
-                {
-                    "question": row[0],
-                    "response_count": row[1],
-                    "correct_count": row[2],
-                    "accuracy": round((row[2] / row[1] * 100) if row[1] > 0 else 0, 2)
-                }
-                for row in result.all()
-            ]
+            .select_from(Question)
+            .join(Section, Question.section_id == Section.id)
+            .outerjoin(Response, Question.id == Response.question_id)
+            .where(Section.exam_id == exam_id)
+            .group_by(Question.id)
+            .order_by(Question.order_index)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        return [
+            {**row, "accuracy": round(row["accuracy"] * 100, 2)}
+            async for row in result.mappings()
+        ]
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Float, Index, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -10,6 +11,7 @@ class Exam(Base):
     title = Column(String(255), nullable=False)
     version = Column(String(50))
     description = Column(Text)
+    total_questions = Column(Integer, default=0)  # 문제 수 (생성 후 바뀌지 않음)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -17,6 +19,9 @@ class Exam(Base):
 
 class Section(Base):
     __tablename__ = "sections"
+    __table_args__ = (
+        Index("ix_sections_exam_order", "exam_id", "order_index"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     exam_id = Column(Integer, ForeignKey("exams.id"), nullable=False)
@@ -28,12 +33,15 @@ class Section(Base):
 
 class Question(Base):
     __tablename__ = "questions"
+    __table_args__ = (
+        Index("ix_questions_section_order", "section_id", "order_index"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     section_id = Column(Integer, ForeignKey("sections.id"), nullable=False)
     question_text = Column(Text, nullable=False)
     order_index = Column(Integer, default=0)
-    images = Column(Text)  # JSON string of image paths
+    images = Column(JSON().with_variant(JSONB, "postgresql"))  # 이미지 경로 목록 (기존 JSON 문자열 데이터와 호환)
     
     section = relationship("Section", back_populates="questions")
     choices = relationship("Choice", back_populates="question", cascade="all, delete-orphan")
@@ -53,6 +61,9 @@ class Choice(Base):
 
 class Answer(Base):
     __tablename__ = "answers"
+    __table_args__ = (
+        Index("ix_answers_question", "question_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
@@ -73,18 +84,23 @@ class Session(Base):
     score = Column(Float)
     total_questions = Column(Integer, default=0)
     correct_answers = Column(Integer, default=0)
+    answered_count = Column(Integer, default=0)  # 답안을 선택한 응답 수
     
     exam = relationship("Exam")
     responses = relationship("Response", back_populates="session", cascade="all, delete-orphan")
 
 class Response(Base):
     __tablename__ = "responses"
+    __table_args__ = (
+        Index("ix_responses_session_question", "session_id", "question_id", unique=True),
+        Index("ix_responses_session_correct", "session_id", "is_correct"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False)
     question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
     selected_choice_id = Column(Integer, ForeignKey("choices.id"))
-    is_correct = Column(Boolean)
+    is_correct = Column(Boolean)  # 응답 UPSERT 시 answers의 정답과 비교해 DB에서 계산
     response_time = Column(DateTime(timezone=True), server_default=func.now())
     notes = Column(Text)
     flagged = Column(Boolean, default=False)
@@ -1,60 +1,114 @@
+"""PDF 시험 문제집 파서
+
+처리 단계는 두 가지로 성격이 다름:
+- 텍스트 추출(fitz get_text): C 코드에서 실행되며 큰 문서에서는 페이지 수에 비례. 큰 PDF는 페이지 구간별로 프로세스 병렬화.
+- 문제 파싱(_create_question_dict): 줄 단위 분기가 대부분인 인터프리터 연산 위주 작업.
+  줄마다 실행되는 명령 수를 줄이는 것(첫 글자 검사, 지역 변수 바인딩, join)이 효과적이며,
+  줄 길이가 짧고 분기 위주라 numpy 배열 같은 벡터화 자료구조는 이득이 없으므로 도입하지 않음.
+"""
 import fitz  # PyMuPDF
 import re
+import functools
 import json
-from typing import List, Dict, Any
+import logging
+import os
+from typing import List, Dict, Any, Iterator, Tuple
 from models import Exam, Section, Question, Choice, Answer
 
+logger = logging.getLogger(__name__)
+
+# 줄마다 반복 실행되는 패턴은 모듈 로드 시 한 번만 컴파일
+QUESTION_HEADER_RE = re.compile(r'QUESTION NO:\s*(\d+)', re.IGNORECASE)
+ANSWER_START_RE = re.compile(r'^Answer:', re.IGNORECASE)
+ANSWER_RE = re.compile(r'Answer:\s*([A-D])', re.IGNORECASE)
+EXPLANATION_START_RE = re.compile(r'^Explanation:', re.IGNORECASE)
+EXPLANATION_RE = re.compile(r'Explanation:\s*(.+)', re.IGNORECASE)
+CHOICE_RE = re.compile(r'^([A-D])[\.\s]+(.+)$', re.IGNORECASE)
+VERSION_RE = re.compile(r'V(\d+\.\d+)')
+
+# 줄의 첫 글자로 후보를 거른 뒤에만 정규식 실행 (IGNORECASE로 일치할 수 있는 첫 글자들)
+ANSWER_FIRST_CHARS = "Aa"
+EXPLANATION_FIRST_CHARS = "Ee"
+# 두 번째 글자도 비교해 "A. ..." 같은 선택지 줄에서 답안 정규식을 건너뜀 (n/x는 유니코드 대소문자 변형이 없음)
+ANSWER_SECOND_CHARS = "Nn"
+EXPLANATION_SECOND_CHARS = "Xx"
+CHOICE_FIRST_CHARS = "ABCDabcd"
+# 선택지 이어짐 확인용 소문자 머리글 (답안/설명 시작 정규식과 같은 판정을 문자 비교로 수행)
+ANSWER_LABEL = "answer:"
+ANSWER_LABEL_LEN = len(ANSWER_LABEL)
+EXPLANATION_LABEL = "explanation:"
+EXPLANATION_LABEL_LEN = len(EXPLANATION_LABEL)
+# 문제 블록 파싱 상태: 문제 본문 수집 / 답안 뒤 줄을 해설로 수집 / 그 외 줄은 무시
+STATE_QUESTION, STATE_ANSWER, STATE_OTHER = 0, 1, 2
+# 제목은 문서 첫 몇 줄에서만 찾음
+TITLE_SEARCH_LINES = 10
+# 버전 표기는 표지에 있으므로 문서 앞부분에서만 찾음
+VERSION_SEARCH_CHARS = 4096
+# 시험 정보는 이 길이의 문서 앞부분만으로 결정하고, 그 앞부분을 키로 결과를 캐시
+EXAM_INFO_HEAD_CHARS = 8192
+
+# 이 페이지 수 이상이면 페이지 구간을 나눠 여러 프로세스에서 텍스트 추출
+PARALLEL_MIN_PAGES = 50
+PARALLEL_MAX_WORKERS = 4
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT
+
+@functools.lru_cache(maxsize=128)
+def _exam_info_from_head(head: str) -> Tuple[str, str]:
+    """문서 앞부분에서 (제목, 버전) 추출 (같은 PDF를 다시 파싱하면 캐시된 결과 사용)"""
+    title = "AWS SAA 시험"
+    version = "Unknown"
+    
+    # 첫 번째 줄에서 제목 추출 시도 (maxsplit으로 앞부분만 나눠 전체 줄 목록을 만들지 않음)
+    for line in head.split('\n', TITLE_SEARCH_LINES)[:TITLE_SEARCH_LINES]:
+        if "AWS" in line and ("SAA" in line or "Solutions" in line):
+            title = line.strip()
+            break
+    
+    # 버전 정보 추출
+    version_match = VERSION_RE.search(head, 0, VERSION_SEARCH_CHARS)
+    if version_match:
+        version = f"V{version_match.group(1)}"
+    
+    return title, version
+
 class PDFParser:
-    def __init__(self):
-        self.question_pattern = r'QUESTION NO:\s*(\d+)'
-        self.choice_pattern = r'^([A-D])\.\s*(.+)$'
-        self.answer_pattern = r'Answer:\s*([A-D])'
-        self.explanation_pattern = r'Explanation:\s*(.+)'
-        
     def parse_pdf(self, pdf_path: str) -> Dict[str, Any]:
         """PDF 파일을 파싱하여 시험 데이터를 추출"""
         try:
-            doc = fitz.open(pdf_path)
-            text_content = ""
-            
-            # 모든 페이지의 텍스트 추출
-            for page in doc:
-                text_content += page.get_text()
-            
-            doc.close()
-            
-            # 시험 정보 추출
-            exam_info = self._extract_exam_info(text_content)
-            
-            # 문제들 파싱
-            questions = self._parse_questions(text_content)
-            
-            print(f"파싱 완료: {len(questions)}개 문제 발견")
-            
-            return {
-                "exam_info": exam_info,
-                "questions": questions
-            }
+            with fitz.open(pdf_path) as doc:
+                return self._parse_doc(doc)
         except Exception as e:
-            print(f"PDF 파싱 중 오류: {e}")
+            logger.error("PDF 파싱 중 오류: %s", e)
             raise
     
-    def _extract_exam_info(self, text: str) -> Dict[str, str]:
-        """시험 정보 추출"""
-        lines = text.split('\n')
-        title = "AWS SAA 시험"
-        version = "Unknown"
+    def _parse_doc(self, doc: fitz.Document) -> Dict[str, Any]:
+        """열린 문서를 한 번 순회하며 파싱 (페이지별 작업은 파일을 다시 열지 않고 이 순회에서 처리)"""
+        # 모든 페이지의 텍스트를 모아 한 번에 join (페이지마다 문자열을 이어 붙이지 않음)
+        texts = []
+        for page in doc:
+            texts.append(page.get_text("text", flags=TEXT_FLAGS))
+            # 이미지 추출(_extract_images)을 구현하면 같은 page 객체로 여기서 호출
+        
+        return self.parse_text("".join(texts))
+    
+    def parse_text(self, text_content: str) -> Dict[str, Any]:
+        """추출된 PDF 텍스트에서 시험 데이터를 추출"""
+        # 시험 정보 추출
+        exam_info = self._extract_exam_info(text_content)
+        
+        # 문제들 파싱
+        questions = self._parse_questions(text_content)
         
-        # 첫 번째 줄에서 제목 추출 시도
-        for line in lines[:10]:
-            if "AWS" in line and ("SAA" in line or "Solutions" in line):
-                title = line.strip()
-                break
+        logger.info("파싱 완료: %d개 문제 발견", len(questions))
         
-        # 버전 정보 추출
-        version_match = re.search(r'V(\d+\.\d+)', text)
-        if version_match:
-            version = f"V{version_match.group(1)}"
+        return {
+            "exam_info": exam_info,
+            "questions": questions
+        }
+    
+    def _extract_exam_info(self, text: str) -> Dict[str, str]:
+        """시험 정보 추출"""
+        title, version = _exam_info_from_head(text[:EXAM_INFO_HEAD_CHARS])
         
         return {
             "title": title,
@@ -66,96 +120,127 @@ class PDFParser:
         """문제들을 파싱"""
         questions = []
         
-        # 문제 번호로 분할 (더 유연한 패턴)
-        question_blocks = re.split(r'QUESTION NO:\s*\d+', text, flags=re.IGNORECASE)[1:]
-        
-        for i, block in enumerate(question_blocks, 1):
+        for number, block in self._iter_question_blocks(text):
             try:
-                question_data = self._create_question_dict(i, block)
+                question_data = self._create_question_dict(number, block)
                 if question_data:
                     questions.append(question_data)
             except Exception as e:
-                print(f"문제 {i} 파싱 중 오류: {e}")
+                logger.warning("문제 %d 파싱 중 오류: %s", number, e)
                 continue
         
         return questions
     
+    def _iter_question_blocks(self, text: str) -> Iterator[Tuple[int, str]]:
+        """문제 번호 헤더 사이의 본문을 한 번의 finditer로 잘라 (헤더의 문제 번호, 본문) 순서대로 반환"""
+        number = start = None
+        for match in QUESTION_HEADER_RE.finditer(text):
+            if start is not None:
+                yield number, text[start:match.start()]
+            number, start = int(match.group(1)), match.end()
+        if start is not None:
+            yield number, text[start:]
+    
     def _create_question_dict(self, question_number: int, block: str) -> Dict[str, Any]:
         """개별 문제 데이터 생성"""
-        lines = block.strip().split('\n')
+        # 줄마다 한 번만 strip (빈 줄은 선택지 이어짐을 끊으므로 빈 문자열로 남겨 둠)
+        lines = [ln.strip() for ln in block.split('\n')]
         
-        # 문제 텍스트 추출
-        question_text = ""
+        # 문제 텍스트 추출 (문자열을 이어 붙이지 않고 조각을 모아 마지막에 join)
+        question_parts = []
         choices = []
         answer = None
-        explanation = ""
+        explanation_parts = []
+        
+        state = STATE_QUESTION
         
-        in_question = True
-        in_choices = False
-        in_answer = False
+        # 루프에서 반복 조회하는 전역/속성을 지역 변수로 한 번만 바인딩
+        answer_start = ANSWER_START_RE.match
+        explanation_start = EXPLANATION_START_RE.match
+        choice_line = CHOICE_RE.match
+        answer_chars = ANSWER_FIRST_CHARS
+        explanation_chars = EXPLANATION_FIRST_CHARS
+        answer_second = ANSWER_SECOND_CHARS
+        explanation_second = EXPLANATION_SECOND_CHARS
+        choice_chars = CHOICE_FIRST_CHARS
+        add_question_line = question_parts.append
+        add_choice = choices.append
         
-        for line in lines:
-            line = line.strip()
+        n = len(lines)
+        i = 0
+        while i < n:
+            line = lines[i]
+            i += 1
             if not line:
                 continue
+            first = line[0]
             
             # 답안 섹션 시작 (대소문자 구분 없이)
-            if re.match(r'^Answer:', line, re.IGNORECASE):
-                in_question = False
-                in_choices = False
-                in_answer = True
-                answer_match = re.search(self.answer_pattern, line, re.IGNORECASE)
+            if first in answer_chars and line[1:2] in answer_second and answer_start(line):
+                state = STATE_ANSWER
+                answer_match = ANSWER_RE.search(line)
                 if answer_match:
                     answer = answer_match.group(1).upper()  # 대문자로 정규화
                 continue
             
             # 설명 섹션 시작 (대소문자 구분 없이)
-            if re.match(r'^Explanation:', line, re.IGNORECASE):
-                in_answer = False
-                explanation_match = re.search(self.explanation_pattern, line, re.IGNORECASE)
+            if first in explanation_chars and line[1:2] in explanation_second and explanation_start(line):
+                if state == STATE_ANSWER:
+                    state = STATE_OTHER
+                explanation_match = EXPLANATION_RE.search(line)
                 if explanation_match:
-                    explanation = explanation_match.group(1)
+                    explanation_parts = [explanation_match.group(1)]
                 continue
             
             # 선택지 확인 (더 유연한 패턴)
-            choice_match = re.search(r'^([A-D])[\.\s]+(.+)$', line, re.IGNORECASE)
+            choice_match = choice_line(line) if first in choice_chars else None
             if choice_match:
-                in_question = False
-                in_choices = True
+                if state == STATE_QUESTION:
+                    state = STATE_OTHER
                 choice_label = choice_match.group(1).upper()  # 대문자로 정규화
-                choice_text = choice_match.group(2).strip()
+                choice_parts = [choice_match.group(2).strip()]
                 
-                # 선택지 텍스트가 다음 줄에 이어지는지 확인
-                next_line_idx = lines.index(line) + 1
-                while next_line_idx < len(lines):
-                    next_line = lines[next_line_idx].strip()
+                # 선택지 텍스트가 다음 줄에 이어지는지 확인 (이어진 줄은 다시 처리하지 않음)
+                while i < n:
+                    next_line = lines[i]
                     if not next_line:
                         break
                     # 다음 줄이 새로운 선택지나 답안/설명 섹션인지 확인
-                    if (re.match(r'^[A-D][\.\s]', next_line, re.IGNORECASE) or 
-                        re.match(r'^Answer:', next_line, re.IGNORECASE) or
-                        re.match(r'^Explanation:', next_line, re.IGNORECASE)):
+                    next_first = next_line[0]
+                    # 정규식 대신 문자 비교로 판정 (ASCII가 아닌 줄만 유니코드 대소문자 규칙을 위해 정규식 사용)
+                    if ((next_first in choice_chars and len(next_line) > 1 and
+                         (next_line[1] == "." or next_line[1].isspace())) or
+                        (next_first in answer_chars and
+                         (next_line[:ANSWER_LABEL_LEN].lower() == ANSWER_LABEL or
+                          not next_line.isascii() and answer_start(next_line))) or
+                        (next_first in explanation_chars and
+                         (next_line[:EXPLANATION_LABEL_LEN].lower() == EXPLANATION_LABEL or
+                          not next_line.isascii() and explanation_start(next_line)))):
                         break
                     # 선택지 텍스트에 추가
-                    choice_text += " " + next_line
-                    next_line_idx += 1
+                    choice_parts.append(next_line)
+                    i += 1
                 
-                choices.append({
+                add_choice({
                     "label": choice_label,
-                    "text": choice_text,
+                    "text": " ".join(choice_parts),
                     "order_index": len(choices)
                 })
                 continue
             
             # 문제 텍스트 또는 설명 추가
-            if in_question:
-                question_text += line + "\n"
-            elif in_answer and line and not re.match(r'^Answer:', line, re.IGNORECASE):
-                explanation += line + "\n"
+            if state == STATE_QUESTION:
+                add_question_line(line)
+            elif state == STATE_ANSWER:  # 답안 줄은 위에서 이미 처리됨
+                explanation_parts.append(line + "\n")
+        
+        question_text = "\n".join(question_parts)
+        explanation = "".join(explanation_parts)
         
         # 최소한 문제 텍스트와 선택지가 있어야 함
         if not question_text.strip() or len(choices) < 2:
-            print(f"문제 {question_number}: 텍스트 또는 선택지 부족 - 텍스트: {len(question_text.strip())}, 선택지: {len(choices)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("문제 %s: 텍스트 또는 선택지 부족 - 텍스트: %d, 선택지: %d", question_number, len(question_text.strip()), len(choices))
             return None
         
         return {
@@ -167,22 +252,37 @@ class PDFParser:
             "images": []  # 이미지 추출은 향후 구현
         }
     
-    def _extract_version(self, text: str) -> str:
-        """PDF에서 버전 정보 추출"""
-        version_patterns = [
-            r'V(\d+\.\d+)',
-            r'Version\s*(\d+\.\d+)',
-            r'v(\d+\.\d+)'
-        ]
-        
-        for pattern in version_patterns:
-            match = re.search(pattern, text)
-            if match:
-                return f"V{match.group(1)}"
-        
-        return "Unknown"
-    
     def _extract_images(self, page) -> List[str]:
         """페이지에서 이미지 추출 (향후 구현)"""
         # 이미지 추출 로직은 향후 구현
         return []
+
+def parse_pdf_file(pdf_path: str) -> Dict[str, Any]:
+    """프로세스 풀에서 실행할 수 있는 최상위 파싱 함수"""
+    return PDFParser().parse_pdf(pdf_path)
+
+def parse_pdf_text(text_content: str) -> Dict[str, Any]:
+    """이미 추출한 텍스트를 프로세스 풀에서 파싱하는 최상위 함수"""
+    return PDFParser().parse_text(text_content)
+
+def get_page_count(pdf_path: str) -> int:
+    """PDF 페이지 수 (본문 텍스트는 읽지 않음)"""
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+def extract_pages(pdf_path: str, start: int, end: int) -> str:
+    """[start, end) 페이지의 텍스트 추출 (작업 프로세스마다 문서를 따로 엶)"""
+    with fitz.open(pdf_path) as doc:
+        return "".join(doc[i].get_text("text", flags=TEXT_FLAGS) for i in range(start, end))
+
+def split_page_ranges(page_count: int) -> List[tuple]:
+    """페이지를 작업자 수만큼 연속 구간으로 나눔"""
+    workers = min(os.cpu_count() or 1, PARALLEL_MAX_WORKERS, page_count)
+    step, extra = divmod(page_count, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        end = start + step + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
@@ -1 +1 @@
-conda activate aws-exam-app && uvicorn app:app --reload --host 0.0.0.0 --port 8000
+conda activate aws-exam-app && TEMPLATE_AUTO_RELOAD=1 uvicorn app:app --reload --host 0.0.0.0 --port 8000